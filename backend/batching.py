@@ -0,0 +1,103 @@
+"""
+Micro-batching of concurrent model inference requests
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Collect concurrent inference requests into a single batched model call
+
+    Requests arriving within ``max_wait`` seconds of the first one in a batch
+    (up to ``max_batch_size`` of them) are stacked into one input tensor, so
+    the fixed per-call overhead of the model is paid once per batch instead
+    of once per request.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], Any], max_batch_size: int = 16, max_wait: float = 0.008):
+        """
+        Args:
+            predict_fn: Function mapping an (N, H, W, C) batch to N results
+            max_batch_size: Maximum number of requests per model call
+            max_wait: Seconds to wait for more requests after the first one
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background batching task on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the background batching task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def predict(self, image_array: np.ndarray):
+        """
+        Queue a single preprocessed image and wait for its prediction
+
+        Args:
+            image_array: Preprocessed image with a batch dimension of 1
+
+        Returns:
+            The inference result for this image
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_array, future))
+        return await future
+
+    async def _collect_batch(self) -> list:
+        """Wait for one request, then gather more until the batch is full or the window closes"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """Background loop that runs one model call per collected batch"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect_batch()
+
+            try:
+                inputs = np.concatenate([image_array for image_array, _ in batch], axis=0)
+
+                # Run the model off the event loop so new requests keep queueing
+                outputs = await loop.run_in_executor(None, self.predict_fn, inputs)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for i, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(outputs[i])
@@ -2,13 +2,29 @@
 Disease treatment suggestions based on disease names
 """
 
-import json
+import functools
+import logging
 import os
-from typing import Dict, Any
+import orjson
+from collections import Counter
+from typing import Dict, Any, Callable, List, Optional, Sequence
 
+logger = logging.getLogger(__name__)
+
+# Response templates for known and unknown diseases
+TREATMENT_TEMPLATE = "{description}\n\nTreatment: {treatment}\n\nPrevention: {prevention}"
+UNKNOWN_TREATMENT_TEMPLATE = "No specific treatment information available for {}. Please consult with a local agricultural extension service or plant pathologist for proper diagnosis and treatment recommendations."
+
+# Callbacks run after a reload, so data derived from the database is rebuilt
+_reload_hooks: List[Callable[[], None]] = []
+
+@functools.lru_cache(maxsize=1)
 def load_treatments_database() -> Dict[str, Any]:
     """
     Load disease treatments from JSON file
+
+    The result is cached for the lifetime of the process; use
+    reload_treatments_database() to pick up changes to the JSON file.
     
     Returns:
         Dictionary containing disease treatments
@@ -18,8 +34,8 @@ def load_treatments_database() -> Dict[str, Any]:
         comprehensive_path = os.path.join(os.path.dirname(__file__), "..", "knowledge_base", "comprehensive_disease_treatments.json")
         
         if os.path.exists(comprehensive_path):
-            with open(comprehensive_path, 'r') as f:
-                comprehensive_data = json.load(f)
+            with open(comprehensive_path, 'rb') as f:
+                comprehensive_data = orjson.loads(f.read())
                 # Flatten the hierarchical structure
                 return flatten_disease_database(comprehensive_data)
         
@@ -27,8 +43,8 @@ def load_treatments_database() -> Dict[str, Any]:
         knowledge_base_path = os.path.join(os.path.dirname(__file__), "..", "knowledge_base", "disease_treatments.json")
         
         if os.path.exists(knowledge_base_path):
-            with open(knowledge_base_path, 'r') as f:
-                return json.load(f)
+            with open(knowledge_base_path, 'rb') as f:
+                return orjson.loads(f.read())
         else:
             # Return default treatments if file doesn't exist
             return get_default_treatments()
@@ -47,12 +63,24 @@ def flatten_disease_database(comprehensive_data: Dict[str, Any]) -> Dict[str, An
     Returns:
         Flattened dictionary with disease names as keys
     """
-    flattened = {}
+    flattened = {
+        disease_name: disease_info
+        for crops in comprehensive_data.values()
+        for diseases in crops.values()
+        for disease_name, disease_info in diseases.items()
+    }
     
-    for category, crops in comprehensive_data.items():
-        for crop, diseases in crops.items():
-            for disease_name, disease_info in diseases.items():
-                flattened[disease_name] = disease_info
+    # Later crops silently overwrite earlier ones with the same disease name
+    total_entries = sum(len(diseases) for crops in comprehensive_data.values() for diseases in crops.values())
+    if total_entries != len(flattened):
+        counts = Counter(
+            disease_name
+            for crops in comprehensive_data.values()
+            for diseases in crops.values()
+            for disease_name in diseases
+        )
+        duplicates = sorted(name for name, count in counts.items() if count > 1)
+        logger.warning(f"Duplicate disease names in treatments database, keeping the last entry: {', '.join(duplicates)}")
     
     return flattened
 
@@ -151,20 +179,98 @@ def get_default_treatments() -> Dict[str, Any]:
         }
     }
 
+def format_treatment(disease_info: Dict[str, Any]) -> str:
+    """
+    Format a disease entry as a treatment suggestion
+    
+    Args:
+        disease_info: Disease entry with description, treatment and prevention
+        
+    Returns:
+        Treatment suggestion string
+    """
+    return TREATMENT_TEMPLATE.format_map(disease_info)
+
+@functools.lru_cache(maxsize=1)
+def load_formatted_treatments() -> Dict[str, str]:
+    """
+    Precompute the treatment suggestion string for every disease
+    
+    Returns:
+        Dictionary mapping disease names to formatted treatment suggestions
+    """
+    return {name: format_treatment(info) for name, info in load_treatments_database().items()}
+
+def build_treatment_index(disease_names: Sequence[str]) -> List[Optional[str]]:
+    """
+    Map each class index directly to its formatted treatment suggestion
+    
+    Classes missing from the treatments database are logged once and map to
+    None, so callers can fall back to get_treatment_suggestion().
+    
+    Args:
+        disease_names: Disease names in model output order
+        
+    Returns:
+        List of treatment suggestions (or None) indexed by class
+    """
+    formatted_treatments = load_formatted_treatments()
+    treatment_index = [formatted_treatments.get(name) for name in disease_names]
+    
+    missing = [f"{i} ({name})" for i, name in enumerate(disease_names) if treatment_index[i] is None]
+    if missing:
+        logger.warning(f"No treatment information for {len(missing)} of {len(disease_names)} classes: {', '.join(missing)}")
+    
+    return treatment_index
+
+def register_reload_hook(hook: Callable[[], None]):
+    """
+    Register a callback to run after reload_treatments_database()
+    
+    Callers holding data built from the database (such as the index from
+    build_treatment_index()) use this to rebuild it.
+    
+    Args:
+        hook: Function called with no arguments once the database is reloaded
+    """
+    _reload_hooks.append(hook)
+
+def reload_treatments_database() -> Dict[str, Any]:
+    """
+    Clear the cached treatments database and load it again from disk
+    
+    Registered reload hooks are run afterwards.
+    
+    Returns:
+        Dictionary containing disease treatments
+    """
+    load_treatments_database.cache_clear()
+    load_formatted_treatments.cache_clear()
+    get_treatment_suggestion.cache_clear()
+    treatments = load_treatments_database()
+    
+    for hook in _reload_hooks:
+        hook()
+    
+    return treatments
+
+@functools.lru_cache(maxsize=128)
 def get_treatment_suggestion(disease_name: str) -> str:
     """
     Get treatment suggestion for a specific disease
     
+    Results are memoized per disease name. The cache holds at most 128 short
+    strings, which covers every class including unknown-disease messages,
+    and is cleared by reload_treatments_database().
+    
     Args:
         disease_name: Name of the disease
         
     Returns:
         Treatment suggestion string
     """
-    treatments_db = load_treatments_database()
+    treatment = load_formatted_treatments().get(disease_name)
     
-    if disease_name in treatments_db:
-        disease_info = treatments_db[disease_name]
-        return f"{disease_info['description']}\n\nTreatment: {disease_info['treatment']}\n\nPrevention: {disease_info['prevention']}"
-    else:
-        return f"No specific treatment information available for {disease_name}. Please consult with a local agricultural extension service or plant pathologist for proper diagnosis and treatment recommendations."
+    if treatment is None:
+        return UNKNOWN_TREATMENT_TEMPLATE.format(disease_name)
+    return treatment
@@ -0,0 +1,90 @@
+"""
+Export the trained Keras model to an int8-quantized TFLite model for serving
+"""
+
+import tensorflow as tf
+import numpy as np
+import os
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    "image_size": (224, 224),
+    "num_calibration_samples": 200,
+    "data_dir": "data/comprehensive_crop_diseases",  # Images used to calibrate activation ranges
+    "model_path": "../models/model.h5",
+    "tflite_path": "../models/model.tflite",
+}
+
+def create_representative_dataset(data_dir: str, image_size: tuple, num_samples: int):
+    """
+    Create a representative dataset generator for int8 calibration
+
+    Args:
+        data_dir: Path to dataset directory
+        image_size: Target image size
+        num_samples: Number of images to calibrate on
+
+    Returns:
+        Generator function yielding single preprocessed images
+    """
+    def representative_dataset():
+        if os.path.exists(data_dir):
+            dataset = tf.keras.utils.image_dataset_from_directory(
+                data_dir,
+                labels=None,
+                image_size=image_size,
+                batch_size=1,
+                shuffle=True,
+                seed=42
+            )
+            for image in dataset.take(num_samples):
+                # Same [0, 1] scaling as preprocess_image
+                yield [tf.cast(image, tf.float32) / 255.0]
+        else:
+            logger.warning(f"Data directory {data_dir} not found. Calibrating on random images.")
+            for _ in range(num_samples):
+                yield [np.random.rand(1, *image_size, 3).astype(np.float32)]
+
+    return representative_dataset
+
+def export_tflite_model(model_path: str, tflite_path: str):
+    """
+    Convert a Keras model to a fully int8-quantized TFLite model
+
+    The input is quantized to uint8 and the output is left as float32, so
+    the server can feed pixels with the input tensor's quantization
+    parameters and read probabilities directly.
+
+    Args:
+        model_path: Path to the Keras model file
+        tflite_path: Path to write the TFLite model to
+    """
+    logger.info(f"Loading Keras model from {model_path}...")
+    model = tf.keras.models.load_model(model_path)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = create_representative_dataset(
+        CONFIG["data_dir"],
+        CONFIG["image_size"],
+        CONFIG["num_calibration_samples"]
+    )
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.float32
+
+    logger.info("Converting model to int8 TFLite...")
+    tflite_model = converter.convert()
+
+    with open(tflite_path, 'wb') as f:
+        f.write(tflite_model)
+
+    logger.info(f"TFLite model saved to {tflite_path} ({len(tflite_model) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    export_tflite_model(CONFIG["model_path"], CONFIG["tflite_path"])
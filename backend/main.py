@@ -7,16 +7,41 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 import numpy as np
-from PIL import Image
-import io
+import hashlib
 import json
 import os
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple
 import logging
+import orjson
+
+# Size TensorFlow's thread pools before it is imported. Every uvicorn worker
+# process runs its own TensorFlow runtime, so set WEB_CONCURRENCY (which
+# uvicorn also reads as its --workers default) to give each of the N
+# workers cpu_count // N intra-op threads instead of all of them
+# oversubscribing every core.
+UVICORN_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+INTRA_OP_THREADS = max(1, (os.cpu_count() or 1) // UVICORN_WORKERS)
+INTER_OP_THREADS = 1
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1")
+os.environ.setdefault("OMP_NUM_THREADS", str(INTRA_OP_THREADS))
+os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(INTRA_OP_THREADS))
+os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(INTER_OP_THREADS))
+
+import tensorflow as tf
 
 # Import our custom modules
-from model_utils import load_model, preprocess_image
-from disease_treatments import get_treatment_suggestion
+from model_utils import (
+    load_model,
+    load_tflite_model,
+    create_inference_function,
+    create_tflite_inference_function,
+    get_num_classes,
+    load_image,
+    preprocess_image,
+)
+from batching import MicroBatcher
+from disease_treatments import build_treatment_index, get_treatment_suggestion, register_reload_hook
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -38,21 +63,114 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global variable to store the loaded model
+# Class names saved by train.py next to the model take precedence over the
+# shared default list in knowledge_base/ (mounted next to main.py in Docker)
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+CLASS_NAMES_PATHS = (
+    os.path.join(MODELS_DIR, "class_names.json"),
+    os.path.join(os.path.dirname(__file__), "..", "knowledge_base", "class_names.json"),
+    os.path.join(os.path.dirname(__file__), "knowledge_base", "class_names.json"),
+)
+
+# Map class index to disease name, loaded on startup
+DISEASE_NAMES: Tuple[str, ...] = ()
+_N_CLASSES = 0
+
+# Model input size (width, height)
+INPUT_SIZE = (224, 224)
+
+# Micro-batching settings for concurrent /predict requests
+BATCH_MAX_SIZE = 16
+BATCH_MAX_WAIT = 0.008  # seconds
+
+# Number of recent predictions kept, keyed by a hash of the uploaded bytes
+PREDICTION_CACHE_SIZE = 1024
+
+# Global variables to store the loaded model, its traced inference
+# function, the request batcher and the per-class treatment suggestions
 model = None
+inference_fn = None
+batcher = None
+treatment_by_index = []
+prediction_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+
+def hash_upload(fileobj) -> bytes:
+    """Hash an uploaded file in chunks and rewind it for decoding"""
+    hasher = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: fileobj.read(1 << 16), b""):
+        hasher.update(chunk)
+    fileobj.seek(0)
+    return hasher.digest()
+
+def load_class_names() -> Tuple[str, ...]:
+    """Load class names saved with the model, falling back to the shared default list"""
+    for path in CLASS_NAMES_PATHS:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                class_names = tuple(orjson.loads(f.read()))
+            logger.info(f"Loaded {len(class_names)} class names from {path}")
+            return class_names
+    raise FileNotFoundError(f"class_names.json not found in any of: {', '.join(CLASS_NAMES_PATHS)}")
+
+def refresh_treatments():
+    """Rebuild the treatment index and drop cached responses after a treatments reload"""
+    global treatment_by_index
+    treatment_by_index = build_treatment_index(DISEASE_NAMES)
+    prediction_cache.clear()
+
+def run_batch_inference(batch: np.ndarray) -> List[Tuple[int, float]]:
+    """Run the model on a batch of preprocessed images"""
+    class_indices, confidences = inference_fn(batch)
+    return list(zip(class_indices.tolist(), confidences.tolist()))
 
 @app.on_event("startup")
 async def load_model_on_startup():
     """Load the trained model when the server starts"""
-    global model
+    global model, inference_fn, batcher, treatment_by_index, DISEASE_NAMES, _N_CLASSES
     try:
-        model_path = os.path.join(os.path.dirname(__file__), "..", "models", "model.h5")
-        model = load_model(model_path)
+        # Must run before the TensorFlow runtime executes its first op
+        tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+        
+        DISEASE_NAMES = load_class_names()
+        _N_CLASSES = len(DISEASE_NAMES)
+        
+        tflite_path = os.path.join(MODELS_DIR, "model.tflite")
+        
+        # Prefer the quantized TFLite export when it is available
+        if os.path.exists(tflite_path):
+            model = load_tflite_model(tflite_path, num_threads=INTRA_OP_THREADS)
+            inference_fn = create_tflite_inference_function(model)
+        else:
+            model = load_model(os.path.join(MODELS_DIR, "model.h5"), num_classes=_N_CLASSES)
+            inference_fn = create_inference_function(model)
         logger.info("Model loaded successfully")
+        
+        num_outputs = get_num_classes(model)
+        if num_outputs != _N_CLASSES:
+            raise ValueError(f"Model has {num_outputs} outputs but {_N_CLASSES} class names were loaded")
+        
+        # Pay graph execution, kernel selection and memory arena setup now
+        # rather than on the first request, at both single and full batch size
+        for batch_size in (1, BATCH_MAX_SIZE):
+            run_batch_inference(np.zeros((batch_size, INPUT_SIZE[1], INPUT_SIZE[0], 3), dtype=np.float32))
+        logger.info("Warmup complete")
+        
+        treatment_by_index = build_treatment_index(DISEASE_NAMES)
+        register_reload_hook(refresh_treatments)
+        
+        batcher = MicroBatcher(run_batch_inference, max_batch_size=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT)
+        batcher.start()
     except Exception as e:
         logger.error(f"Failed to load model: {str(e)}")
         raise e
 
+@app.on_event("shutdown")
+async def stop_batcher_on_shutdown():
+    """Stop the inference batcher when the server shuts down"""
+    if batcher is not None:
+        await batcher.stop()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -64,12 +182,13 @@ async def health_check():
     return {"status": "healthy", "model_loaded": model is not None}
 
 @app.post("/predict")
-async def predict_disease(file: UploadFile = File(...)):
+async def predict_disease(file: UploadFile = File(...), no_cache: bool = False):
     """
     Predict crop disease from uploaded image
     
     Args:
         file: Uploaded image file
+        no_cache: Skip the recent-predictions cache and always run the model
         
     Returns:
         JSON response with disease prediction and treatment suggestion
@@ -79,75 +198,39 @@ async def predict_disease(file: UploadFile = File(...)):
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read image data
-        image_data = await file.read()
-        
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(image_data))
+        # Identical uploads skip decoding and inference entirely
+        cache_key = None
+        if not no_cache:
+            cache_key = hash_upload(file.file)
+            cached_response = prediction_cache.get(cache_key)
+            if cached_response is not None:
+                prediction_cache.move_to_end(cache_key)
+                logger.info(f"Prediction served from cache: {cached_response['disease_name']}")
+                return JSONResponse(content=cached_response)
         
-        # Convert to RGB if necessary
-        if image.mode != "RGB":
-            image = image.convert("RGB")
+        # Decode the spooled upload directly instead of buffering it in memory
+        image = load_image(file.file, INPUT_SIZE)
         
         # Preprocess image
-        processed_image = preprocess_image(image)
+        processed_image = preprocess_image(image, INPUT_SIZE)
         
         # Make prediction
-        if model is None:
+        if model is None or batcher is None:
             raise HTTPException(status_code=500, detail="Model not loaded")
         
-        predictions = model.predict(processed_image)
-        
         # Get the class with highest probability
-        class_index = np.argmax(predictions[0])
-        confidence = float(predictions[0][class_index])
-        
-        # Map class index to disease name - Comprehensive list
-        disease_names = [
-            # CEREALS - Wheat (4)
-            "Wheat Rust", "Wheat Blast", "Wheat Scab", "Wheat Healthy",
-            # CEREALS - Rice (4)
-            "Rice Blast", "Rice Brown Spot", "Rice Bacterial Blight", "Rice Healthy",
-            # CEREALS - Corn (5)
-            "Corn Northern Leaf Blight", "Corn Common Rust", "Corn Gray Leaf Spot", "Corn Southern Rust", "Corn Healthy",
-            # CEREALS - Barley (3)
-            "Barley Scald", "Barley Net Blotch", "Barley Healthy",
-            # VEGETABLES - Tomato (10)
-            "Tomato Bacterial Spot", "Tomato Early Blight", "Tomato Late Blight", "Tomato Leaf Mold",
-            "Tomato Septoria Leaf Spot", "Tomato Spider Mites", "Tomato Target Spot",
-            "Tomato Yellow Leaf Curl Virus", "Tomato Mosaic Virus", "Tomato Healthy",
-            # VEGETABLES - Potato (5)
-            "Potato Early Blight", "Potato Late Blight", "Potato Scab", "Potato Blackleg", "Potato Healthy",
-            # VEGETABLES - Pepper (3)
-            "Pepper Bacterial Spot", "Pepper Anthracnose", "Pepper Healthy",
-            # VEGETABLES - Cucumber (4)
-            "Cucumber Downy Mildew", "Cucumber Powdery Mildew", "Cucumber Anthracnose", "Cucumber Healthy",
-            # VEGETABLES - Lettuce (3)
-            "Lettuce Downy Mildew", "Lettuce Bacterial Soft Rot", "Lettuce Healthy",
-            # VEGETABLES - Carrot (3)
-            "Carrot Leaf Blight", "Carrot Root Rot", "Carrot Healthy",
-            # FRUITS - Apple (4)
-            "Apple Scab", "Apple Fire Blight", "Apple Powdery Mildew", "Apple Healthy",
-            # FRUITS - Citrus (4)
-            "Citrus Canker", "Citrus Greening", "Citrus Melanose", "Citrus Healthy",
-            # FRUITS - Grape (4)
-            "Grape Downy Mildew", "Grape Powdery Mildew", "Grape Black Rot", "Grape Healthy",
-            # FRUITS - Strawberry (4)
-            "Strawberry Powdery Mildew", "Strawberry Gray Mold", "Strawberry Anthracnose", "Strawberry Healthy",
-            # LEGUMES - Soybean (3)
-            "Soybean Rust", "Soybean Bacterial Blight", "Soybean Healthy",
-            # LEGUMES - Bean (3)
-            "Bean Anthracnose", "Bean Rust", "Bean Healthy",
-            # ROOT CROPS - Sweet Potato (2)
-            "Sweet Potato Scab", "Sweet Potato Healthy",
-            # ROOT CROPS - Cassava (3)
-            "Cassava Mosaic Disease", "Cassava Brown Streak Disease", "Cassava Healthy"
-        ]
-        
-        disease_name = disease_names[class_index] if class_index < len(disease_names) else "Unknown Disease"
+        class_index, confidence = await batcher.predict(processed_image)
+        
+        if class_index < _N_CLASSES:
+            disease_name = DISEASE_NAMES[class_index]
+            treatment = treatment_by_index[class_index]
+        else:
+            disease_name = "Unknown Disease"
+            treatment = None
         
         # Get treatment suggestion
-        treatment = get_treatment_suggestion(disease_name)
+        if treatment is None:
+            treatment = get_treatment_suggestion(disease_name)
         
         # Prepare response
         response = {
@@ -156,6 +239,11 @@ async def predict_disease(file: UploadFile = File(...)):
             "treatment_suggestion": treatment
         }
         
+        if cache_key is not None:
+            prediction_cache[cache_key] = response
+            if len(prediction_cache) > PREDICTION_CACHE_SIZE:
+                prediction_cache.popitem(last=False)
+        
         logger.info(f"Prediction completed: {disease_name} (confidence: {confidence:.2f})")
         
         return JSONResponse(content=response)
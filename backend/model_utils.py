@@ -10,12 +10,13 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def load_model(model_path: str):
+def load_model(model_path: str, num_classes: int = 85):
     """
     Load the trained model from file
     
     Args:
         model_path: Path to the model file
+        num_classes: Number of output classes for the dummy fallback model
         
     Returns:
         Loaded TensorFlow model
@@ -23,7 +24,7 @@ def load_model(model_path: str):
     try:
         if not os.path.exists(model_path):
             logger.warning(f"Model file not found at {model_path}. Creating a dummy model for testing.")
-            return create_dummy_model()
+            return create_dummy_model(num_classes)
         
         model = tf.keras.models.load_model(model_path)
         logger.info(f"Model loaded successfully from {model_path}")
@@ -32,12 +33,15 @@ def load_model(model_path: str):
     except Exception as e:
         logger.error(f"Failed to load model from {model_path}: {str(e)}")
         logger.info("Creating a dummy model for testing")
-        return create_dummy_model()
+        return create_dummy_model(num_classes)
 
-def create_dummy_model():
+def create_dummy_model(num_classes: int = 85):
     """
     Create a dummy model for testing when the actual model is not available
     
+    Args:
+        num_classes: Number of output classes
+        
     Returns:
         Dummy TensorFlow model
     """
@@ -45,7 +49,7 @@ def create_dummy_model():
     model = tf.keras.Sequential([
         tf.keras.layers.Input(shape=(224, 224, 3)),
         tf.keras.layers.GlobalAveragePooling2D(),
-        tf.keras.layers.Dense(85, activation='softmax')  # 85 comprehensive disease classes
+        tf.keras.layers.Dense(num_classes, activation='softmax')
     ])
     
     # Compile the model
@@ -58,6 +62,172 @@ def create_dummy_model():
     logger.info("Dummy model created for testing")
     return model
 
+def load_tflite_model(model_path: str, num_threads: int = None):
+    """
+    Load a TFLite model into an interpreter
+    
+    Args:
+        model_path: Path to the .tflite model file
+        num_threads: Number of CPU threads for the interpreter (defaults to all cores)
+        
+    Returns:
+        TFLite interpreter with tensors allocated
+    """
+    interpreter = tf.lite.Interpreter(
+        model_path=model_path,
+        num_threads=num_threads or os.cpu_count()
+    )
+    interpreter.allocate_tensors()
+    logger.info(f"TFLite model loaded successfully from {model_path}")
+    return interpreter
+
+def get_num_classes(model) -> int:
+    """
+    Get the number of output classes of a Keras model or TFLite interpreter
+    
+    Args:
+        model: TensorFlow model or TFLite interpreter
+        
+    Returns:
+        Size of the model's output dimension
+    """
+    if isinstance(model, tf.lite.Interpreter):
+        return int(model.get_output_details()[0]["shape"][-1])
+    return int(model.output_shape[-1])
+
+def create_logits_function(model):
+    """
+    Build a function computing the model's pre-softmax logits
+    
+    When the final layer is a softmax Dense layer, its activation is skipped
+    so that serving does not normalize all class scores; otherwise the log of
+    the model output stands in for the logits.
+    
+    Args:
+        model: TensorFlow model
+        
+    Returns:
+        Function mapping an image batch tensor to a logits tensor
+    """
+    output_layer = model.layers[-1]
+    
+    if isinstance(output_layer, tf.keras.layers.Dense) and getattr(output_layer.activation, "__name__", None) == "softmax":
+        features_model = tf.keras.Model(model.inputs, output_layer.input)
+        
+        def logits_fn(images):
+            features = tf.cast(features_model(images, training=False), output_layer.kernel.dtype)
+            logits = tf.matmul(features, output_layer.kernel)
+            if output_layer.use_bias:
+                logits = logits + output_layer.bias
+            return logits
+    else:
+        def logits_fn(images):
+            return tf.math.log(model(images, training=False))
+    
+    return logits_fn
+
+def create_inference_function(model, input_shape: tuple = (224, 224, 3)):
+    """
+    Trace the model once into a concrete graph function for inference
+    
+    Args:
+        model: TensorFlow model
+        input_shape: Input image shape, without the batch dimension
+        
+    Returns:
+        Function mapping a float32 image batch to (class_indices, confidences) arrays
+    """
+    logits_fn = create_logits_function(model)
+    
+    def classify(images):
+        logits = tf.cast(logits_fn(images), tf.float32)
+        
+        # Argmax is unchanged by softmax, so only the winning class is normalized
+        top = tf.math.top_k(logits, k=1)
+        confidences = tf.exp(top.values[:, 0] - tf.reduce_logsumexp(logits, axis=1))
+        return top.indices[:, 0], confidences
+    
+    # Only the class index and confidence per image leave the graph
+    concrete_fn = tf.function(
+        classify,
+        input_signature=[tf.TensorSpec(shape=(None,) + tuple(input_shape), dtype=tf.float32)]
+    ).get_concrete_function()
+    
+    def inference_fn(images: np.ndarray):
+        class_indices, confidences = concrete_fn(tf.constant(images))
+        return class_indices.numpy(), confidences.numpy()
+    
+    return inference_fn
+
+def create_tflite_inference_function(interpreter):
+    """
+    Wrap a TFLite interpreter as a batch inference function
+    
+    The interpreter is not thread-safe, so the returned function must not be
+    called concurrently.
+    
+    Args:
+        interpreter: TFLite interpreter with tensors allocated
+        
+    Returns:
+        Function mapping a float32 image batch to (class_indices, confidences) arrays
+    """
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+    input_scale, input_zero_point = input_details["quantization"]
+    output_scale, output_zero_point = output_details["quantization"]
+    
+    def inference_fn(images: np.ndarray):
+        # Quantize [0, 1] floats with the input tensor's parameters
+        if input_scale:
+            limits = np.iinfo(input_details["dtype"])
+            images = np.clip(np.round(images / input_scale + input_zero_point), limits.min, limits.max)
+        images = images.astype(input_details["dtype"])
+        
+        # The converted model has a fixed batch size of 1
+        outputs = []
+        for image in images:
+            interpreter.set_tensor(input_details["index"], image[None, ...])
+            interpreter.invoke()
+            outputs.append(interpreter.get_tensor(output_details["index"])[0])
+        outputs = np.stack(outputs)
+        
+        if output_scale:
+            outputs = (outputs.astype(np.float32) - output_zero_point) * output_scale
+        
+        class_indices = outputs.argmax(axis=1)
+        return class_indices, outputs[np.arange(len(outputs)), class_indices]
+    
+    return inference_fn
+
+def load_image(fp, target_size: tuple = (224, 224)) -> Image.Image:
+    """
+    Decode an image file at roughly the resolution the model needs
+    
+    For JPEGs, draft mode lets libjpeg's DCT scaling decode at 1/2, 1/4 or
+    1/8 resolution while staying at least as large as target_size, so
+    phone photos are never fully decoded only to be downsampled. Other
+    formats are decoded at full size.
+    
+    Args:
+        fp: Path or binary file object of the encoded image
+        target_size: Size the image will be resized to (width, height)
+        
+    Returns:
+        Decoded RGB PIL Image
+    """
+    image = Image.open(fp)
+    
+    # Must come before load(), convert() or resize() to take effect
+    image.draft("RGB", target_size)
+    image.load()
+    
+    # Convert to RGB if necessary
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    return image
+
 def preprocess_image(image: Image.Image, target_size: tuple = (224, 224)) -> np.ndarray:
     """
     Preprocess image for model inference
@@ -70,18 +240,15 @@ def preprocess_image(image: Image.Image, target_size: tuple = (224, 224)) -> np.
         Preprocessed image array ready for model input
     """
     try:
-        # Resize image
-        image = image.resize(target_size)
-        
-        # Convert to numpy array
-        image_array = np.array(image)
-        
-        # Normalize pixel values to [0, 1]
-        image_array = image_array.astype(np.float32) / 255.0
-        
-        # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-        
+        # Resize image (bilinear, which takes Pillow-SIMD's vectorized path)
+        # and view it as uint8 without copying
+        pixels = np.asarray(image.resize(target_size, Image.BILINEAR), dtype=np.uint8)
+
+        # Normalize pixel values to [0, 1] straight into a batch of one,
+        # so the cast and scale happen in a single pass
+        image_array = np.empty((1,) + pixels.shape, dtype=np.float32)
+        np.multiply(pixels, np.float32(1.0 / 255.0), out=image_array[0])
+
         return image_array
         
     except Exception as e:
@@ -4,86 +4,100 @@ Training script for fine-tuning MobileNetV2 on PlantVillage dataset
 
 import tensorflow as tf
 from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
+from tensorflow.keras.layers import (
+    Dense, GlobalAveragePooling2D, Dropout,
+    Rescaling, RandomFlip, RandomRotation, RandomTranslation, RandomZoom
+)
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from tensorflow.keras import mixed_precision
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
 import numpy as np
 import os
 import json
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Disease class names, in model output order, shared with the API server
+CLASS_NAMES_PATH = os.path.join(os.path.dirname(__file__), "..", "knowledge_base", "class_names.json")
+with open(CLASS_NAMES_PATH, 'r') as f:
+    CLASS_NAMES = tuple(json.load(f))
+
+def default_precision_policy() -> str:
+    """
+    Pick the Keras precision policy for this machine
+    
+    float16 on GPUs and float32 on CPUs, where bfloat16 was slower than
+    float32 for MobileNetV2 even with AMX. Set PRECISION_POLICY (for
+    example to mixed_bfloat16) to override.
+    """
+    if "PRECISION_POLICY" in os.environ:
+        return os.environ["PRECISION_POLICY"]
+    if tf.config.list_physical_devices("GPU"):
+        return "mixed_float16"
+    return "float32"
+
 # Configuration
 CONFIG = {
     "image_size": (224, 224),
     "batch_size": 32,
     "epochs": 50,
     "learning_rate": 0.001,
-    "num_classes": 85,  # Expanded number of disease classes
+    "num_classes": len(CLASS_NAMES),
     "data_dir": "data/comprehensive_crop_diseases",  # Path to comprehensive dataset
     "model_save_path": "../models/comprehensive_model.h5",
-    "class_names": [
-        # CEREALS - Wheat (4)
-        "Wheat Rust", "Wheat Blast", "Wheat Scab", "Wheat Healthy",
-        # CEREALS - Rice (4)
-        "Rice Blast", "Rice Brown Spot", "Rice Bacterial Blight", "Rice Healthy",
-        # CEREALS - Corn (5)
-        "Corn Northern Leaf Blight", "Corn Common Rust", "Corn Gray Leaf Spot", "Corn Southern Rust", "Corn Healthy",
-        # CEREALS - Barley (3)
-        "Barley Scald", "Barley Net Blotch", "Barley Healthy",
-        # VEGETABLES - Tomato (10)
-        "Tomato Bacterial Spot", "Tomato Early Blight", "Tomato Late Blight", "Tomato Leaf Mold",
-        "Tomato Septoria Leaf Spot", "Tomato Spider Mites", "Tomato Target Spot",
-        "Tomato Yellow Leaf Curl Virus", "Tomato Mosaic Virus", "Tomato Healthy",
-        # VEGETABLES - Potato (5)
-        "Potato Early Blight", "Potato Late Blight", "Potato Scab", "Potato Blackleg", "Potato Healthy",
-        # VEGETABLES - Pepper (3)
-        "Pepper Bacterial Spot", "Pepper Anthracnose", "Pepper Healthy",
-        # VEGETABLES - Cucumber (4)
-        "Cucumber Downy Mildew", "Cucumber Powdery Mildew", "Cucumber Anthracnose", "Cucumber Healthy",
-        # VEGETABLES - Lettuce (3)
-        "Lettuce Downy Mildew", "Lettuce Bacterial Soft Rot", "Lettuce Healthy",
-        # VEGETABLES - Carrot (3)
-        "Carrot Leaf Blight", "Carrot Root Rot", "Carrot Healthy",
-        # FRUITS - Apple (4)
-        "Apple Scab", "Apple Fire Blight", "Apple Powdery Mildew", "Apple Healthy",
-        # FRUITS - Citrus (4)
-        "Citrus Canker", "Citrus Greening", "Citrus Melanose", "Citrus Healthy",
-        # FRUITS - Grape (4)
-        "Grape Downy Mildew", "Grape Powdery Mildew", "Grape Black Rot", "Grape Healthy",
-        # FRUITS - Strawberry (4)
-        "Strawberry Powdery Mildew", "Strawberry Gray Mold", "Strawberry Anthracnose", "Strawberry Healthy",
-        # LEGUMES - Soybean (3)
-        "Soybean Rust", "Soybean Bacterial Blight", "Soybean Healthy",
-        # LEGUMES - Bean (3)
-        "Bean Anthracnose", "Bean Rust", "Bean Healthy",
-        # ROOT CROPS - Sweet Potato (2)
-        "Sweet Potato Scab", "Sweet Potato Healthy",
-        # ROOT CROPS - Cassava (3)
-        "Cassava Mosaic Disease", "Cassava Brown Streak Disease", "Cassava Healthy"
-    ]
+    "class_names": CLASS_NAMES,
+    "shuffle_buffer_size": 1024,  # Decoded training images shuffled at a time
+    "dataset_cache_path": "",  # File prefix for the decoded image cache; empty caches in memory
+    "precision_policy": default_precision_policy(),
 }
 
-def create_model(num_classes: int, input_shape: tuple = (224, 224, 3)):
+# Names of the classification head layers added by create_model(): the
+# pooling layer whose output feeds the head, then the trainable head layers
+HEAD_POOLING_LAYER = "head_pooling"
+HEAD_LAYERS = ("head_dense", "head_dropout", "head_predictions")
+
+# Under a mixed policy, run layers in reduced precision while keeping
+# float32 master weights
+mixed_precision.set_global_policy(CONFIG["precision_policy"])
+
+def create_optimizer(learning_rate: float):
+    """
+    Create the Adam optimizer for the active precision policy
+    
+    Args:
+        learning_rate: Learning rate
+        
+    Returns:
+        Adam optimizer, wrapped in a LossScaleOptimizer under float16
+    """
+    optimizer = Adam(learning_rate=learning_rate)
+    if mixed_precision.global_policy().compute_dtype == "float16":
+        # Scale the loss so small float16 gradients do not underflow
+        optimizer = mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
+
+def create_model(num_classes: int, input_shape: tuple = (224, 224, 3), weights: str = 'imagenet'):
     """
     Create MobileNetV2 model for crop disease classification
     
     Args:
         num_classes: Number of output classes
         input_shape: Input image shape
+        weights: Initial MobileNetV2 weights ('imagenet' or None)
         
     Returns:
         Compiled Keras model
     """
     # Load pre-trained MobileNetV2
     base_model = MobileNetV2(
-        weights='imagenet',
+        weights=weights,
         include_top=False,
         input_shape=input_shape
     )
@@ -93,75 +107,146 @@ def create_model(num_classes: int, input_shape: tuple = (224, 224, 3)):
     
     # Add custom classification head
     x = base_model.output
-    x = GlobalAveragePooling2D()(x)
-    x = Dense(512, activation='relu')(x)
-    x = Dropout(0.5)(x)
-    predictions = Dense(num_classes, activation='softmax')(x)
+    x = GlobalAveragePooling2D(name=HEAD_POOLING_LAYER)(x)
+    x = Dense(512, activation='relu', name=HEAD_LAYERS[0])(x)
+    x = Dropout(0.5, name=HEAD_LAYERS[1])(x)
+    # Keep the softmax in float32 so the loss stays numerically stable
+    predictions = Dense(num_classes, activation='softmax', dtype='float32', name=HEAD_LAYERS[2])(x)
     
     # Create the model
     model = Model(inputs=base_model.input, outputs=predictions)
     
     # Compile the model
     model.compile(
-        optimizer=Adam(learning_rate=CONFIG["learning_rate"]),
+        optimizer=create_optimizer(CONFIG["learning_rate"]),
         loss='categorical_crossentropy',
         metrics=['accuracy']
     )
     
     return model
 
-def create_data_generators(data_dir: str, image_size: tuple, batch_size: int):
+def create_datasets(data_dir: str, image_size: tuple, batch_size: int, class_names: tuple = CLASS_NAMES, augment: bool = True, cache_path: str = ""):
     """
-    Create data generators for training and validation
+    Create tf.data pipelines for training and validation
+    
+    Decoding, augmentation and rescaling run inside the TensorFlow graph on
+    its own thread pool and are prefetched to overlap with training steps.
+    Decoded images are cached as uint8 (in memory, or in cache_path when
+    given) so each file is only read and resized once; training images are
+    cached individually so they can be reshuffled and augmented freshly
+    every epoch.
     
     Args:
         data_dir: Path to dataset directory
         image_size: Target image size
         batch_size: Batch size for training
+        class_names: Class subdirectory names, in model output order
+        augment: Whether to apply random augmentation to the training set
+        cache_path: File prefix to cache decoded images to instead of memory
         
     Returns:
-        Tuple of (train_generator, validation_generator)
+        Tuple of (train_dataset, validation_dataset)
     """
-    # Data augmentation for training
-    train_datagen = ImageDataGenerator(
-        rescale=1./255,
-        rotation_range=20,
-        width_shift_range=0.2,
-        height_shift_range=0.2,
-        horizontal_flip=True,
-        zoom_range=0.2,
-        shear_range=0.2,
-        fill_mode='nearest',
-        validation_split=0.2  # Use 20% for validation
+    # Both subsets must use the same shuffle seed so the split does not overlap
+    dataset_args = dict(
+        validation_split=0.2,  # Use 20% for validation
+        seed=42,
+        image_size=image_size,
+        batch_size=batch_size,
+        label_mode='categorical',
+        class_names=list(class_names)
     )
+    train_dataset = tf.keras.utils.image_dataset_from_directory(data_dir, subset='training', **dataset_args)
+    val_dataset = tf.keras.utils.image_dataset_from_directory(data_dir, subset='validation', **dataset_args)
+    
+    # Kept in float32 whatever the global precision policy is
+    rescale = Rescaling(1./255, dtype='float32')
+    
+    def to_uint8(x, y):
+        # Resized pixels are floats in [0, 255]; uint8 is a quarter of the size
+        return tf.cast(tf.clip_by_value(tf.round(x), 0, 255), tf.uint8), y
     
     # No augmentation for validation
-    val_datagen = ImageDataGenerator(
-        rescale=1./255,
-        validation_split=0.2
+    val_dataset = (
+        val_dataset
+        .map(to_uint8, num_parallel_calls=tf.data.AUTOTUNE)
+        .cache(f"{cache_path}_val" if cache_path else "")
+        .map(lambda x, y: (rescale(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
     )
     
-    # Training generator
-    train_generator = train_datagen.flow_from_directory(
-        data_dir,
-        target_size=image_size,
-        batch_size=batch_size,
-        class_mode='categorical',
-        subset='training',
-        shuffle=True
+    if not augment:
+        train_dataset = (
+            train_dataset
+            .map(lambda x, y: (rescale(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE)
+        )
+        return train_dataset, val_dataset
+    
+    # Data augmentation for training, in float32 because RandomRotation
+    # does not accept bfloat16 images
+    augmentation = tf.keras.Sequential([
+        RandomFlip('horizontal', dtype='float32'),
+        RandomRotation(20 / 360, fill_mode='nearest', dtype='float32'),
+        RandomTranslation(0.2, 0.2, fill_mode='nearest', dtype='float32'),
+        RandomZoom(0.2, fill_mode='nearest', dtype='float32'),
+    ])
+    
+    # Cache decoded images one by one, then shuffle, batch and augment
+    # freshly every epoch
+    train_dataset = (
+        train_dataset
+        .map(to_uint8, num_parallel_calls=tf.data.AUTOTUNE)
+        .unbatch()
+        .cache(f"{cache_path}_train" if cache_path else "")
+        .shuffle(CONFIG["shuffle_buffer_size"], reshuffle_each_iteration=True)
+        .batch(batch_size)
+        .map(lambda x, y: (augmentation(rescale(x), training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
     )
     
-    # Validation generator
-    val_generator = val_datagen.flow_from_directory(
-        data_dir,
-        target_size=image_size,
-        batch_size=batch_size,
-        class_mode='categorical',
-        subset='validation',
-        shuffle=False
-    )
+    return train_dataset, val_dataset
+
+def extract_features(feature_extractor, dataset):
+    """
+    Run a frozen feature extractor once over a dataset
+    
+    Args:
+        feature_extractor: Model mapping images to feature vectors
+        dataset: Dataset of (images, labels) batches
+        
+    Returns:
+        Tuple of (features, labels) arrays
+    """
+    features, labels = [], []
     
-    return train_generator, val_generator
+    # Iterate images and labels together so they stay aligned under shuffling
+    for images, batch_labels in dataset:
+        batch_features = feature_extractor(images, training=False)
+        features.append(tf.cast(batch_features, tf.float32).numpy())
+        labels.append(batch_labels.numpy())
+    
+    return np.concatenate(features), np.concatenate(labels)
+
+def save_float32_model(model, model_path: str):
+    """
+    Save a float32 copy of a mixed-precision model for serving
+    
+    Layers saved under a mixed policy would run in reduced precision after
+    loading, which is slow on CPUs without native float16/bfloat16 support.
+    
+    Args:
+        model: Trained Keras model
+        model_path: Path to save the model to
+    """
+    policy = mixed_precision.global_policy()
+    mixed_precision.set_global_policy("float32")
+    try:
+        float32_model = create_model(CONFIG["num_classes"], CONFIG["image_size"] + (3,), weights=None)
+        float32_model.set_weights(model.get_weights())
+        float32_model.save(model_path)
+    finally:
+        mixed_precision.set_global_policy(policy)
 
 def train_model():
     """
@@ -181,81 +266,125 @@ def train_model():
     # Print model summary
     model.summary()
     
-    # Create data generators
-    logger.info("Creating data generators...")
-    train_generator, val_generator = create_data_generators(
+    # Create datasets
+    logger.info("Creating datasets...")
+    train_dataset, val_dataset = create_datasets(
         CONFIG["data_dir"],
         CONFIG["image_size"],
-        CONFIG["batch_size"]
+        CONFIG["batch_size"],
+        augment=False
     )
     
-    # Create callbacks
-    callbacks = [
-        ModelCheckpoint(
-            CONFIG["model_save_path"],
-            monitor='val_accuracy',
-            save_best_only=True,
-            mode='max',
-            verbose=1
-        ),
-        EarlyStopping(
-            monitor='val_accuracy',
-            patience=10,
-            restore_best_weights=True,
-            verbose=1
-        ),
-        ReduceLROnPlateau(
-            monitor='val_loss',
-            factor=0.5,
-            patience=5,
-            min_lr=1e-7,
+    # The backbone is frozen in this phase, so its pooled features are the
+    # same every epoch: compute them once and train only the head on them
+    logger.info("Extracting frozen backbone features...")
+    pooling_layer = model.get_layer(HEAD_POOLING_LAYER)
+    feature_extractor = Model(inputs=model.input, outputs=pooling_layer.output)
+    train_features, train_labels = extract_features(feature_extractor, train_dataset)
+    val_features, val_labels = extract_features(feature_extractor, val_dataset)
+    
+    # The head shares its layers with the full model, so training it trains the model
+    head = tf.keras.Sequential(
+        [tf.keras.Input(shape=train_features.shape[1:])] + [model.get_layer(name) for name in HEAD_LAYERS]
+    )
+    head.compile(
+        optimizer=create_optimizer(CONFIG["learning_rate"]),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    
+    # EarlyStopping only restores the best weights when it actually stops
+    # early, so checkpoint the best head separately and reload it after fit
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        best_head_path = os.path.join(checkpoint_dir, "best_head.h5")
+        
+        # Create callbacks
+        callbacks = [
+            ModelCheckpoint(
+                best_head_path,
+                monitor='val_accuracy',
+                save_best_only=True,
+                save_weights_only=True,
+                mode='max',
+                verbose=1
+            ),
+            EarlyStopping(
+                monitor='val_accuracy',
+                patience=10,
+                verbose=1
+            ),
+            ReduceLROnPlateau(
+                monitor='val_loss',
+                factor=0.5,
+                patience=5,
+                min_lr=1e-7,
+                verbose=1
+            )
+        ]
+        
+        # Train the model
+        logger.info("Starting training...")
+        history = head.fit(
+            train_features,
+            train_labels,
+            batch_size=CONFIG["batch_size"],
+            epochs=CONFIG["epochs"],
+            validation_data=(val_features, val_labels),
+            callbacks=callbacks,
+            shuffle=True,
             verbose=1
         )
-    ]
+        
+        # The head shares its layers with the full model, so this restores
+        # the best validation-accuracy epoch in the full model too
+        head.load_weights(best_head_path)
     
-    # Train the model
-    logger.info("Starting training...")
-    history = model.fit(
-        train_generator,
-        epochs=CONFIG["epochs"],
-        validation_data=val_generator,
-        callbacks=callbacks,
-        verbose=1
-    )
+    # Save the full model, with the best checkpointed head, as float32 for serving
+    save_float32_model(model, CONFIG["model_save_path"])
     
     # Save class names
     class_names_path = os.path.join(os.path.dirname(CONFIG["model_save_path"]), "class_names.json")
     with open(class_names_path, 'w') as f:
-        json.dump(CONFIG["class_names"], f)
+        json.dump(list(CONFIG["class_names"]), f)
     
     logger.info(f"Training completed! Model saved to {CONFIG['model_save_path']}")
     
     return history
 
-def create_dummy_dataset():
+def create_dummy_dataset(images_per_class: int = 10):
     """
     Create a dummy dataset for demonstration purposes
+    
+    Args:
+        images_per_class: Number of random images to write per class
     """
+    from PIL import Image
+    
     logger.info("Creating dummy dataset for demonstration...")
     
-    # Create directory structure
-    os.makedirs(CONFIG["data_dir"], exist_ok=True)
+    # Generate every dummy image in a single allocation
+    class_names = CONFIG["class_names"]
+    dummy_images = np.random.randint(
+        0, 256, (len(class_names), images_per_class) + CONFIG["image_size"] + (3,), dtype=np.uint8
+    )
     
-    # Create dummy images for each class
-    for i, class_name in enumerate(CONFIG["class_names"]):
-        class_dir = os.path.join(CONFIG["data_dir"], class_name)
-        os.makedirs(class_dir, exist_ok=True)
-        
-        # Create 10 dummy images per class
-        for j in range(10):
-            # Create a random image
-            dummy_image = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
-            
-            # Save as image
-            from PIL import Image
-            img = Image.fromarray(dummy_image)
-            img_path = os.path.join(class_dir, f"dummy_{j}.jpg")
-            img.save(img_path)
+    def save_image(i: int, j: int):
+        img_path = os.path.join(CONFIG["data_dir"], class_names[i], f"dummy_{j}.jpg")
+        Image.fromarray(dummy_images[i, j]).save(img_path, "JPEG", quality=75)
+    
+    # Create directory structure
+    for class_name in class_names:
+        os.makedirs(os.path.join(CONFIG["data_dir"], class_name), exist_ok=True)
+    
+    # JPEG encoding releases the GIL, so the writes overlap across threads
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [
+            executor.submit(save_image, i, j)
+            for i in range(len(class_names))
+            for j in range(images_per_class)
+        ]
+        for future in futures:
+            future.result()
     
     logger.info("Dummy dataset created successfully!")
 
@@ -269,8 +398,9 @@ def fine_tune_model(model_path: str, epochs: int = 10):
     """
     logger.info("Starting fine-tuning...")
     
-    # Load the model
-    model = tf.keras.models.load_model(model_path)
+    # Rebuild the model under the active precision policy and load its weights
+    model = create_model(CONFIG["num_classes"], CONFIG["image_size"] + (3,), weights=None)
+    model.load_weights(model_path)
     
     # Unfreeze some layers for fine-tuning
     for layer in model.layers[-20:]:  # Unfreeze last 20 layers
@@ -278,29 +408,30 @@ def fine_tune_model(model_path: str, epochs: int = 10):
     
     # Recompile with lower learning rate
     model.compile(
-        optimizer=Adam(learning_rate=CONFIG["learning_rate"] * 0.1),
+        optimizer=create_optimizer(CONFIG["learning_rate"] * 0.1),
         loss='categorical_crossentropy',
         metrics=['accuracy']
     )
     
-    # Create data generators
-    train_generator, val_generator = create_data_generators(
+    # Create datasets
+    train_dataset, val_dataset = create_datasets(
         CONFIG["data_dir"],
         CONFIG["image_size"],
-        CONFIG["batch_size"]
+        CONFIG["batch_size"],
+        cache_path=CONFIG["dataset_cache_path"]
     )
     
     # Fine-tune
     history = model.fit(
-        train_generator,
+        train_dataset,
         epochs=epochs,
-        validation_data=val_generator,
+        validation_data=val_dataset,
         verbose=1
     )
     
     # Save fine-tuned model
     fine_tuned_path = model_path.replace('.h5', '_fine_tuned.h5')
-    model.save(fine_tuned_path)
+    save_float32_model(model, fine_tuned_path)
     
     logger.info(f"Fine-tuning completed! Model saved to {fine_tuned_path}")
     
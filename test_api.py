@@ -4,91 +4,171 @@ Test script for Crop Disease Detection API
 """
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.filepost import encode_multipart_formdata
+import orjson
 import os
-from PIL import Image
-import numpy as np
-import io
+import sys
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 API_BASE_URL = "http://localhost:8000"
+HEALTH_URL = f"{API_BASE_URL}/health"
+PREDICT_URL = f"{API_BASE_URL}/predict"
 
-def create_test_image():
-    """Create a test image for API testing"""
-    # Create a random RGB image
-    image_array = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
+# Sample upload shipped with the repository
+SAMPLE_IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "sample.jpg")
+
+# One keep-alive connection pool shared by all tests. uvicorn only speaks
+# HTTP/1.1, so an HTTP/2 client would end up on the same kind of
+# keep-alive connections this pool already reuses.
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0))
+# Responses are small JSON over loopback, so skip gzip decoding
+SESSION.headers.update({'Accept-Encoding': 'identity', 'Connection': 'keep-alive'})
+
+def _build_test_jpeg():
+    """Encode a random RGB image as JPEG bytes"""
+    # Imported here so runs that use the sample fixture never load them
+    import numpy as np
+    
+    # Create a random RGB image covering the full 0..255 range, from a
+    # seeded PCG64 generator so the test image is reproducible
+    image_array = np.random.default_rng(0).integers(0, 256, size=(224, 224, 3), dtype=np.uint8)
+    
+    try:
+        # libjpeg-turbo encoder that takes numpy arrays directly
+        import simplejpeg
+    except ImportError:
+        simplejpeg = None
+    
+    if simplejpeg is not None:
+        # Encode straight from the numpy buffer with libjpeg-turbo's fast
+        # integer DCT, without wrapping the array in a PIL image first
+        return simplejpeg.encode_jpeg(np.ascontiguousarray(image_array), quality=75, colorspace='RGB', fastdct=True)
+    
+    # Fall back to PIL, whose default JPEG quality is also 75
+    import io
+    from PIL import Image
+    
     image = Image.fromarray(image_array)
     
     # Save to bytes
     img_bytes = io.BytesIO()
     image.save(img_bytes, format='JPEG')
-    img_bytes.seek(0)
     
-    return img_bytes
+    return img_bytes.getvalue()
+
+@functools.lru_cache(maxsize=1)
+def create_test_image():
+    """Create a test image for API testing, as encoded JPEG bytes
+
+    The checked-in sample image is used when present; otherwise one is
+    generated. Either way it is built once and reused by every upload.
+    """
+    if os.path.exists(SAMPLE_IMAGE_PATH):
+        with open(SAMPLE_IMAGE_PATH, 'rb') as f:
+            return f.read()
+    return _build_test_jpeg()
+
+@functools.lru_cache(maxsize=1)
+def create_upload_body():
+    """Encode the test image as a multipart/form-data upload once
+
+    Returns:
+        (body, content_type) to post as-is on every predict request
+    """
+    return encode_multipart_formdata([('file', ('test_image.jpg', create_test_image(), 'image/jpeg'))])
+
+def _report(lines):
+    """Write a test's output lines as one uninterrupted block"""
+    sys.stdout.write("\n".join(lines) + "\n\n")
 
-def test_health_endpoint():
-    """Test the health endpoint"""
-    print("🔍 Testing health endpoint...")
+def test_health_endpoint(lines=None):
+    """Test the health endpoint
+
+    Output lines are appended to ``lines`` when it is given, and written
+    out straight away otherwise.
+    """
+    report = lines is None
+    if report:
+        lines = []
+    lines.append("🔍 Testing health endpoint...")
     try:
-        response = requests.get(f"{API_BASE_URL}/health")
+        response = SESSION.get(HEALTH_URL)
         if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Health check passed: {data}")
+            data = orjson.loads(response.content)
+            lines.append(f"✅ Health check passed: {data}")
             return True
         else:
-            print(f"❌ Health check failed: {response.status_code}")
+            lines.append(f"❌ Health check failed: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ Health check error: {str(e)}")
+        lines.append(f"❌ Health check error: {str(e)}")
         return False
+    finally:
+        if report:
+            _report(lines)
+
+def test_predict_endpoint(lines=None):
+    """Test the predict endpoint
 
-def test_predict_endpoint():
-    """Test the predict endpoint"""
-    print("🔍 Testing predict endpoint...")
+    Output lines are appended to ``lines`` when it is given, and written
+    out straight away otherwise.
+    """
+    report = lines is None
+    if report:
+        lines = []
+    lines.append("🔍 Testing predict endpoint...")
     try:
-        # Create test image
-        test_image = create_test_image()
-        
-        # Prepare files for upload
-        files = {'file': ('test_image.jpg', test_image, 'image/jpeg')}
+        # Prepare the upload; the multipart envelope is only built once
+        body, content_type = create_upload_body()
         
         # Make request
-        response = requests.post(f"{API_BASE_URL}/predict", files=files)
+        response = SESSION.post(PREDICT_URL, data=body, headers={'Content-Type': content_type})
         
         if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Prediction successful:")
-            print(f"   Disease: {data['disease_name']}")
-            print(f"   Confidence: {data['confidence_score']}%")
-            print(f"   Treatment: {data['treatment_suggestion'][:100]}...")
+            data = orjson.loads(response.content)
+            lines.append(f"✅ Prediction successful:")
+            lines.append(f"   Disease: {data['disease_name']}")
+            lines.append(f"   Confidence: {data['confidence_score']}%")
+            lines.append(f"   Treatment: {data['treatment_suggestion'][:100]}...")
             return True
         else:
-            print(f"❌ Prediction failed: {response.status_code}")
-            print(f"   Response: {response.text}")
+            lines.append(f"❌ Prediction failed: {response.status_code}")
+            lines.append(f"   Response: {response.text}")
             return False
     except Exception as e:
-        print(f"❌ Prediction error: {str(e)}")
+        lines.append(f"❌ Prediction error: {str(e)}")
         return False
+    finally:
+        if report:
+            _report(lines)
 
 def main():
     """Run all tests"""
-    print("🧪 Starting API tests...")
-    print(f"API Base URL: {API_BASE_URL}")
-    print("-" * 50)
+    sys.stdout.write(f"🧪 Starting API tests...\nAPI Base URL: {API_BASE_URL}\n{'-' * 50}\n")
     
-    # Test health endpoint
-    health_ok = test_health_endpoint()
-    print()
-    
-    # Test predict endpoint
-    predict_ok = test_predict_endpoint()
-    print()
+    # Both probes are network-bound, so run them concurrently, collecting
+    # their output to write in a fixed order once both have finished
+    health_lines, predict_lines = [], []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        health_future = executor.submit(test_health_endpoint, health_lines)
+        predict_future = executor.submit(test_predict_endpoint, predict_lines)
+        health_ok = health_future.result()
+        predict_ok = predict_future.result()
+    _report(health_lines)
+    _report(predict_lines)
     
     # Summary
-    print("-" * 50)
     if health_ok and predict_ok:
-        print("🎉 All tests passed! API is working correctly.")
+        summary = "🎉 All tests passed! API is working correctly."
     else:
-        print("❌ Some tests failed. Check the API server.")
+        summary = "❌ Some tests failed. Check the API server."
+    sys.stdout.write(f"{'-' * 50}\n{summary}\n")
+    
+    # Output is written in whole blocks and flushed once
+    sys.stdout.flush()
     
     return health_ok and predict_ok
 